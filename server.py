@@ -1,17 +1,72 @@
 import asyncio
 import logging
+from datetime import datetime, timezone
+import numpy as np
+import uvloop
+from numba import njit
 from asyncua import Server, ua
 from asyncua.common.methods import uamethod
-import random
-from datetime import datetime
+
+__all__ = ["SawMillServer"]
+
+# Positions of each sensor in SawMillServer._sensors
+IDX_CUTTING_SPEED = 0
+IDX_MOTOR_SPEED = 1
+IDX_POWER_CONSUMPTION = 2
+IDX_TEMPERATURE = 3
+IDX_VIBRATION = 4
+IDX_PRESSURE = 5
+SENSOR_NAMES = ("cutting_speed", "motor_speed", "power_consumption", "temperature", "vibration", "pressure")
+
+# Alarm conditions reported by step_sensors, in order of precedence
+ALARM_NONE = 0
+ALARM_POWER = 1
+ALARM_TEMPERATURE = 2
+ALARM_VIBRATION = 3
+
+
+@njit(cache=True)
+def step_sensors(sensors, targets, deltas, mins, maxs):
+    """Advance the sensor vector in place by one tick and return the active alarm condition"""
+    # Cutting speed (15-25 m/min) and motor speed (±5% variation) vary around their targets
+    sensors[IDX_CUTTING_SPEED] = targets[IDX_CUTTING_SPEED] + deltas[IDX_CUTTING_SPEED]
+    sensors[IDX_MOTOR_SPEED] = targets[IDX_MOTOR_SPEED] + deltas[IDX_MOTOR_SPEED]
+
+    # Power consumption varies with cutting speed, 2kW per m/min deviation
+    sensors[IDX_POWER_CONSUMPTION] = (targets[IDX_POWER_CONSUMPTION]
+                                      + (sensors[IDX_CUTTING_SPEED] - targets[IDX_CUTTING_SPEED]) * 2
+                                      + deltas[IDX_POWER_CONSUMPTION])
+
+    # Temperature (40-60°C, slow changes), vibration (2-10 mm/s RMS)
+    # and hydraulic pressure (150-200 bar) drift from their last values
+    sensors[IDX_TEMPERATURE] += deltas[IDX_TEMPERATURE]
+    sensors[IDX_VIBRATION] += deltas[IDX_VIBRATION]
+    sensors[IDX_PRESSURE] += deltas[IDX_PRESSURE]
+
+    # Limit all sensors to their realistic ranges
+    for i in range(sensors.shape[0]):
+        if sensors[i] < mins[i]:
+            sensors[i] = mins[i]
+        elif sensors[i] > maxs[i]:
+            sensors[i] = maxs[i]
+
+    if sensors[IDX_POWER_CONSUMPTION] > 85:
+        return ALARM_POWER
+    if sensors[IDX_TEMPERATURE] > 55:
+        return ALARM_TEMPERATURE
+    if sensors[IDX_VIBRATION] > 8:
+        return ALARM_VIBRATION
+    return ALARM_NONE
 
 
 class SawMillServer:
     def __init__(self):
         self.server = Server()
         self.sawmill_vars = {}
+        self._sensor_vars = []
         self.logger = logging.getLogger(__name__)
         self._running = True
+        self._tick = 0
 
         # Target values for parameters (realistic industrial values)
         self.target_values = {
@@ -24,6 +79,23 @@ class SawMillServer:
             "pieces_count": 0
         }
 
+        # Sensor targets, and the last simulated values so ticks don't read them back from the address space
+        self._sensor_targets = np.array([self.target_values[name] for name in SENSOR_NAMES], dtype=np.float64)
+        self._sensors = self._sensor_targets.copy()
+        self._pieces = self.target_values["pieces_count"]
+
+        # Last written flag values, so unchanged flags are not rewritten every tick
+        self._last_stopped = True
+        self._last_alarm = False
+        self._last_error = False
+
+        # Per-tick random variation and allowed range, ordered like self._sensors
+        self._rng = np.random.default_rng()
+        self._delta_lows = np.array([-2.0, -90.0, -1.0, -0.2, -0.3, -2.0])
+        self._delta_highs = np.array([2.0, 90.0, 1.0, 0.3, 0.3, 2.0])
+        self._sensor_mins = np.array([15.0, 1710.0, 60.0, 40.0, 2.0, 150.0])
+        self._sensor_maxs = np.array([25.0, 1890.0, 90.0, 60.0, 10.0, 200.0])
+
     async def init(self):
         await self.server.init()
 
@@ -34,7 +106,7 @@ class SawMillServer:
         # Register namespace
         uri = "http://examples.freeopcua.github.io"
         idx = await self.server.register_namespace(uri)
-        self.logger.info(f"Registered namespace with index {idx}: {uri}")
+        self.logger.info("Registered namespace with index %s: %s", idx, uri)
 
         # Create base structure
         root = self.server.nodes.objects
@@ -88,112 +160,152 @@ class SawMillServer:
             f"ns={idx};s={sensors_path}/Vibration", "Vibration", self.target_values["vibration"])
         self.sawmill_vars["pressure"] = await sensors.add_variable(
             f"ns={idx};s={sensors_path}/Pressure", "Pressure", self.target_values["pressure"])
-        self.sawmill_vars["speed"] = await sensors.add_variable(
-            f"ns={idx};s={sensors_path}/Speed", "Speed", self.target_values["motor_speed"])
+
+        # Expose the motor speed under Sensors as well, instead of a duplicate Speed variable
+        await sensors.add_reference(self.sawmill_vars["motor_speed"], ua.ObjectIds.Organizes)
 
         # Make variables writable
         for var in self.sawmill_vars.values():
             await var.set_writable()
 
+        # Bind variables to attributes so the simulation loop skips dict lookups
+        self.var_is_active = self.sawmill_vars["is_active"]
+        self.var_is_working = self.sawmill_vars["is_working"]
+        self.var_is_stopped = self.sawmill_vars["is_stopped"]
+        self.var_pieces_count = self.sawmill_vars["pieces_count"]
+        self.var_has_alarm = self.sawmill_vars["has_alarm"]
+        self.var_has_error = self.sawmill_vars["has_error"]
+
+        # Sensor nodes in the same order as the sensor state vector
+        self._sensor_vars = [self.sawmill_vars[name] for name in SENSOR_NAMES]
+
         # Log created variables
         for name, var in self.sawmill_vars.items():
             node_id = var.nodeid.to_string()
-            self.logger.info(f"Created variable {name} with node ID: {node_id}")
+            self.logger.info("Created variable %s with node ID: %s", name, node_id)
 
     async def start(self):
         """Start the server and run the simulation"""
         self._running = True
         self.logger.info("Starting server...")
 
+        loop = asyncio.get_running_loop()
+
+        # Run short coroutines inline until they first suspend (Python 3.12+)
+        if hasattr(asyncio, "eager_task_factory"):
+            loop.set_task_factory(asyncio.eager_task_factory)
+
         async with self.server:
+            # Sleep until absolute deadlines so update time doesn't accumulate as drift
+            next_deadline = loop.time()
             while self._running:
                 await self.update_simulation()
-                await asyncio.sleep(1)
+                next_deadline += 1.0
+                now = loop.time()
+                if next_deadline < now:
+                    # Fell behind: skip missed ticks rather than running them back to back
+                    next_deadline = now
+                await asyncio.sleep(next_deadline - now)
 
     async def stop(self):
         """Stop the server gracefully"""
         self._running = False
         self.logger.info("Stopping server...")
 
+    async def _write_values(self, updates):
+        """Write all updated (node, variant) pairs in a single internal session write"""
+        if not updates:
+            return []
+        now = datetime.now(timezone.utc)
+        params = ua.WriteParameters()
+        for var, variant in updates:
+            params.NodesToWrite.append(ua.WriteValue(
+                NodeId=var.nodeid,
+                AttributeId=ua.AttributeIds.Value,
+                Value=ua.DataValue(variant, SourceTimestamp=now),
+            ))
+        results = await self.server.iserver.isession.write(params)
+        for (var, _), status in zip(updates, results):
+            if not status.is_good():
+                self.logger.warning("Failed to write %s: %s", var.nodeid.to_string(), status)
+        return results
+
+    def _remember_flags(self, updates, results):
+        """Record flag values that were written successfully, so failed writes are retried next tick"""
+        for (var, variant), status in zip(updates, results):
+            if not status.is_good():
+                continue
+            if var is self.var_is_stopped:
+                self._last_stopped = variant.Value
+            elif var is self.var_has_alarm:
+                self._last_alarm = variant.Value
+            elif var is self.var_has_error:
+                self._last_error = variant.Value
+
+    def _set_alarm(self, updates, value):
+        """Queue a HasAlarm write only when the flag changes"""
+        if self._last_alarm != value:
+            updates.append((self.var_has_alarm, ua.Variant(value, ua.VariantType.Boolean)))
+
+    def _set_error(self, updates, value):
+        """Queue a HasError write only when the flag changes"""
+        if self._last_error != value:
+            updates.append((self.var_has_error, ua.Variant(value, ua.VariantType.Boolean)))
+
     async def update_simulation(self):
         """Update simulation values with realistic changes"""
+        updates = []
         try:
             # Read current states
-            is_active = await self.sawmill_vars["is_active"].read_value()
-            is_working = await self.sawmill_vars["is_working"].read_value()
+            is_active = await self.var_is_active.read_value()
+            is_working = await self.var_is_working.read_value()
 
-            # Every 10 seconds toggle active state to simulate machine cycles
-            current_time = datetime.now()
-            if current_time.second % 10 == 0:
+            # Every 10 ticks toggle active state to simulate machine cycles
+            self._tick = (self._tick + 1) % 10
+            if self._tick == 0:
                 new_active = not is_active
                 new_working = not is_working
-                await self.sawmill_vars["is_active"].write_value(new_active)
-                await self.sawmill_vars["is_working"].write_value(new_working)
-                await self.sawmill_vars["is_stopped"].write_value(not new_active)
-                self.logger.info(f"Toggled machine state - Active: {new_active}, Working: {new_working}")
+                updates.append((self.var_is_active, ua.Variant(new_active, ua.VariantType.Boolean)))
+                updates.append((self.var_is_working, ua.Variant(new_working, ua.VariantType.Boolean)))
+                if self._last_stopped != (not new_active):
+                    updates.append((self.var_is_stopped, ua.Variant(not new_active, ua.VariantType.Boolean)))
+                self.logger.info("Toggled machine state - Active: %s, Working: %s", new_active, new_working)
 
             if is_active:
-                # Update cutting speed (15-25 m/min)
-                current_speed = await self.sawmill_vars["cutting_speed"].read_value()
-                new_speed = self.target_values["cutting_speed"] + random.uniform(-2, 2)
-                new_speed = max(15, min(25, new_speed))
-                await self.sawmill_vars["cutting_speed"].write_value(new_speed)
-
-                # Update motor speed (±5% variation)
-                motor_speed = self.target_values["motor_speed"] + random.uniform(-90, 90)
-                await self.sawmill_vars["motor_speed"].write_value(motor_speed)
-                await self.sawmill_vars["speed"].write_value(motor_speed)  # Update speed sensor
-
-                # Update power consumption (varies with cutting speed)
-                power_base = self.target_values["power_consumption"]
-                power = power_base + (new_speed - 20) * 2  # 2kW per m/min deviation
-                power += random.uniform(-1, 1)  # Small random variation
-                power = max(60, min(90, power))  # Limit to realistic range
-                await self.sawmill_vars["power_consumption"].write_value(power)
-
-                # Update temperature (40-60°C, slow changes)
-                current_temp = await self.sawmill_vars["temperature"].read_value()
-                new_temp = current_temp + random.uniform(-0.2, 0.3)
-                new_temp = max(40, min(60, new_temp))
-                await self.sawmill_vars["temperature"].write_value(new_temp)
-
-                # Update vibration (2-10 mm/s RMS)
-                current_vib = await self.sawmill_vars["vibration"].read_value()
-                new_vib = current_vib + random.uniform(-0.3, 0.3)
-                new_vib = max(2, min(10, new_vib))
-                await self.sawmill_vars["vibration"].write_value(new_vib)
-
-                # Update hydraulic pressure (150-200 bar)
-                current_pressure = await self.sawmill_vars["pressure"].read_value()
-                new_pressure = current_pressure + random.uniform(-2, 2)
-                new_pressure = max(150, min(200, new_pressure))
-                await self.sawmill_vars["pressure"].write_value(new_pressure)
+                deltas = self._rng.uniform(self._delta_lows, self._delta_highs)
+                alarm = step_sensors(self._sensors, self._sensor_targets, deltas,
+                                     self._sensor_mins, self._sensor_maxs)
+                values = self._sensors.tolist()
+
+                updates.extend((var, ua.Variant(value, ua.VariantType.Double))
+                               for var, value in zip(self._sensor_vars, values))
 
                 if is_working:
                     # Increment piece count (20% chance per second when working)
-                    if random.random() < 0.2:
-                        pieces = await self.sawmill_vars["pieces_count"].read_value()
-                        await self.sawmill_vars["pieces_count"].write_value(pieces + 1)
-
-                    # Handle alarms and errors
-                    if power > 85:  # High power consumption alarm
-                        await self.sawmill_vars["has_alarm"].write_value(True)
-                        self.logger.warning(f"High power consumption alarm triggered: {power:.1f} kW")
-                    elif new_temp > 55:  # High temperature alarm
-                        await self.sawmill_vars["has_alarm"].write_value(True)
-                        self.logger.warning(f"High temperature alarm triggered: {new_temp:.1f}°C")
-                    elif new_vib > 8:  # High vibration alarm
-                        await self.sawmill_vars["has_alarm"].write_value(True)
-                        self.logger.warning(f"High vibration alarm triggered: {new_vib:.1f} mm/s")
-                    elif random.random() < 0.01:  # 1% chance of random error
-                        await self.sawmill_vars["has_error"].write_value(True)
+                    if self._rng.random() < 0.2:
+                        self._pieces += 1
+                        updates.append((self.var_pieces_count, ua.Variant(self._pieces, ua.VariantType.Int64)))
+
+                    # Handle alarms and errors: an alarm clears the error flag, otherwise 1% chance of random error
+                    has_alarm = alarm != ALARM_NONE
+                    has_error = not has_alarm and self._rng.random() < 0.01
+                    self._set_alarm(updates, has_alarm)
+                    self._set_error(updates, has_error)
+
+                    if alarm == ALARM_POWER:
+                        self.logger.warning("High power consumption alarm triggered: %.1f kW", values[IDX_POWER_CONSUMPTION])
+                    elif alarm == ALARM_TEMPERATURE:
+                        self.logger.warning("High temperature alarm triggered: %.1f°C", values[IDX_TEMPERATURE])
+                    elif alarm == ALARM_VIBRATION:
+                        self.logger.warning("High vibration alarm triggered: %.1f mm/s", values[IDX_VIBRATION])
+                    elif has_error:
                         self.logger.warning("Random error triggered")
-                    else:
-                        await self.sawmill_vars["has_alarm"].write_value(False)
-                        await self.sawmill_vars["has_error"].write_value(False)
+
+            results = await self._write_values(updates)
+            self._remember_flags(updates, results)
 
         except Exception as e:
-            self.logger.error(f"Error in simulation update: {e}", exc_info=True)
+            self.logger.error("Error in simulation update: %s", e, exc_info=True)
 
 
 async def main():
@@ -205,4 +317,4 @@ async def main():
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(main())
+    uvloop.run(main())